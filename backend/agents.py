@@ -1,9 +1,13 @@
 """Multi-agent orchestration for travel concierge."""
 
+import re
 from dataclasses import dataclass, field
 from typing import Optional
 from enum import Enum
-from data import search_flights, search_hotels, search_activities, get_travel_guide
+from data import (
+    FLIGHTS, HOTELS, ACTIVITIES, GUIDES_LC,
+    search_flights, search_hotels, search_activities, get_travel_guide,
+)
 
 
 class AgentType(Enum):
@@ -14,7 +18,7 @@ class AgentType(Enum):
     GUIDE_AGENT = "guide_agent"
 
 
-@dataclass
+@dataclass(slots=True)
 class TravelPreferences:
     destination: Optional[str] = None
     origin: Optional[str] = None
@@ -25,7 +29,7 @@ class TravelPreferences:
     interests: list = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True)
 class Booking:
     booking_type: str  # flight, hotel, activity
     item_id: str
@@ -33,7 +37,7 @@ class Booking:
     confirmed: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class Itinerary:
     preferences: TravelPreferences
     flights: list = field(default_factory=list)
@@ -43,6 +47,74 @@ class Itinerary:
     confirmed: bool = False
 
 
+def keyword_pattern(words: tuple[str, ...]) -> re.Pattern:
+    """Compile keywords into one alternation so a message is scanned once per intent."""
+    return re.compile("|".join(map(re.escape, words)))
+
+
+_STARS = ["", "⭐", "⭐⭐", "⭐⭐⭐", "⭐⭐⭐⭐", "⭐⭐⭐⭐⭐"]
+
+_FLIGHT_TEMPLATE = (
+    "- **{airline}** ({id})\n"
+    "  {from} → {to}\n"
+    "  Departure: {departure} | Arrival: {arrival}\n"
+    "  Price: ${price} ({class})\n\n"
+)
+_HOTEL_TEMPLATE = (
+    "- **{name}** ({id}) - {city}\n"
+    "  Rating: {stars} ({rating})\n"
+    "  Price: ${price_per_night}/night\n"
+    "  Amenities: {amenity_list}\n"
+    "  {description}\n\n"
+)
+_ACTIVITY_TEMPLATE = (
+    "- **{name}** ({id})\n"
+    "  Location: {city} | Duration: {duration}\n"
+    "  Price: ${price}\n"
+    "  {description}\n\n"
+)
+_GUIDE_HEADER_TEMPLATE = (
+    "**Travel Guide: {city}**\n\n"
+    "**Best Time to Visit:** {best_time}\n"
+    "**Currency:** {currency}\n"
+    "**Language:** {language}\n\n"
+)
+_SUMMARY_FLIGHT_TEMPLATE = "- {airline}: {from} → {to} (${price})\n"
+_SUMMARY_HOTEL_TEMPLATE = "- {name} - ${price_per_night}/night\n"
+_SUMMARY_ACTIVITY_TEMPLATE = "- {name} (${price})\n"
+
+
+def _render_flight(f: dict) -> str:
+    return _FLIGHT_TEMPLATE.format_map(f)
+
+
+def _render_hotel(h: dict) -> str:
+    return _HOTEL_TEMPLATE.format(
+        stars=_STARS[int(h['rating'])],
+        amenity_list=', '.join(h['amenities']),
+        **h
+    )
+
+
+def _render_activity(a: dict) -> str:
+    return _ACTIVITY_TEMPLATE.format_map(a)
+
+
+def _render_guide(guide: dict) -> str:
+    parts = [_GUIDE_HEADER_TEMPLATE.format_map(guide), "**Must-See Attractions:**\n"]
+    parts.extend(f"- {place}\n" for place in guide['must_see'])
+    parts.append("\n**Travel Tips:**\n")
+    parts.extend(f"- {tip}\n" for tip in guide['tips'])
+    return "".join(parts)
+
+
+# The catalog is static, so each entry is rendered once at import
+_RENDERED_FLIGHTS = {f['id']: _render_flight(f) for f in FLIGHTS}
+_RENDERED_HOTELS = {h['id']: _render_hotel(h) for h in HOTELS}
+_RENDERED_ACTIVITIES = {a['id']: _render_activity(a) for a in ACTIVITIES}
+_PREFORMATTED_GUIDES = {g['city']: _render_guide(g) for g in GUIDES_LC.values()}
+
+
 class FlightAgent:
     """Agent specialized in flight search and booking."""
 
@@ -53,13 +125,9 @@ class FlightAgent:
         if not flights:
             return "No flights found matching your criteria."
 
-        result = "**Available Flights:**\n\n"
-        for f in flights:
-            result += f"- **{f['airline']}** ({f['id']})\n"
-            result += f"  {f['from']} → {f['to']}\n"
-            result += f"  Departure: {f['departure']} | Arrival: {f['arrival']}\n"
-            result += f"  Price: ${f['price']} ({f['class']})\n\n"
-        return result
+        parts = ["**Available Flights:**\n\n"]
+        parts.extend(_RENDERED_FLIGHTS.get(f['id']) or _render_flight(f) for f in flights)
+        return "".join(parts)
 
 
 class HotelAgent:
@@ -72,14 +140,9 @@ class HotelAgent:
         if not hotels:
             return "No hotels found matching your criteria."
 
-        result = "**Available Hotels:**\n\n"
-        for h in hotels:
-            result += f"- **{h['name']}** ({h['id']}) - {h['city']}\n"
-            result += f"  Rating: {'⭐' * int(h['rating'])} ({h['rating']})\n"
-            result += f"  Price: ${h['price_per_night']}/night\n"
-            result += f"  Amenities: {', '.join(h['amenities'])}\n"
-            result += f"  {h['description']}\n\n"
-        return result
+        parts = ["**Available Hotels:**\n\n"]
+        parts.extend(_RENDERED_HOTELS.get(h['id']) or _render_hotel(h) for h in hotels)
+        return "".join(parts)
 
 
 class ActivityAgent:
@@ -92,13 +155,9 @@ class ActivityAgent:
         if not activities:
             return "No activities found for this destination."
 
-        result = "**Available Activities:**\n\n"
-        for a in activities:
-            result += f"- **{a['name']}** ({a['id']})\n"
-            result += f"  Location: {a['city']} | Duration: {a['duration']}\n"
-            result += f"  Price: ${a['price']}\n"
-            result += f"  {a['description']}\n\n"
-        return result
+        parts = ["**Available Activities:**\n\n"]
+        parts.extend(_RENDERED_ACTIVITIES.get(a['id']) or _render_activity(a) for a in activities)
+        return "".join(parts)
 
 
 class GuideAgent:
@@ -111,22 +170,21 @@ class GuideAgent:
         if not guide:
             return "Sorry, I don't have a guide for that destination yet."
 
-        result = f"**Travel Guide: {guide['city']}**\n\n"
-        result += f"**Best Time to Visit:** {guide['best_time']}\n"
-        result += f"**Currency:** {guide['currency']}\n"
-        result += f"**Language:** {guide['language']}\n\n"
-        result += "**Must-See Attractions:**\n"
-        for place in guide['must_see']:
-            result += f"- {place}\n"
-        result += "\n**Travel Tips:**\n"
-        for tip in guide['tips']:
-            result += f"- {tip}\n"
-        return result
+        return _PREFORMATTED_GUIDES.get(guide['city']) or _render_guide(guide)
 
 
 class CoordinatorAgent:
     """Main coordinator that orchestrates other agents."""
 
+    _CONFIRM_RE = keyword_pattern(('confirm', 'book it', 'yes book', 'proceed'))
+    _FLIGHT_RE = keyword_pattern(('flight', 'fly', 'airplane', 'plane'))
+    _HOTEL_RE = keyword_pattern(('hotel', 'stay', 'accommodation', 'room'))
+    _ACTIVITY_RE = keyword_pattern(('activity', 'activities', 'things to do', 'tour', 'attraction'))
+    _GUIDE_RE = keyword_pattern(('guide', 'tips', 'advice', 'recommend', 'must see', 'best time'))
+
+    _DESTINATIONS = ('paris', 'london', 'tokyo', 'rome', 'new york', 'los angeles')
+    _DESTINATION_RE = keyword_pattern(_DESTINATIONS)
+
     def __init__(self):
         self.flight_agent = FlightAgent()
         self.hotel_agent = HotelAgent()
@@ -141,31 +199,29 @@ class CoordinatorAgent:
         message_lower = message.lower()
 
         # Check for booking confirmation
-        if any(word in message_lower for word in ['confirm', 'book it', 'yes book', 'proceed']):
+        if self._CONFIRM_RE.search(message_lower):
             return "confirmation", "confirm"
 
         # Check for flight-related queries
-        if any(word in message_lower for word in ['flight', 'fly', 'airplane', 'plane']):
+        if self._FLIGHT_RE.search(message_lower):
             return self._handle_flight_query(message, preferences)
 
         # Check for hotel-related queries
-        if any(word in message_lower for word in ['hotel', 'stay', 'accommodation', 'room']):
+        if self._HOTEL_RE.search(message_lower):
             return self._handle_hotel_query(message, preferences)
 
         # Check for activity-related queries
-        if any(word in message_lower for word in ['activity', 'activities', 'things to do', 'tour', 'attraction']):
+        if self._ACTIVITY_RE.search(message_lower):
             return self._handle_activity_query(message, preferences)
 
         # Check for travel guide queries
-        if any(word in message_lower for word in ['guide', 'tips', 'advice', 'recommend', 'must see', 'best time']):
+        if self._GUIDE_RE.search(message_lower):
             return self._handle_guide_query(message, preferences)
 
         # Check for destination mentions and update preferences
-        destinations = ['paris', 'london', 'tokyo', 'rome', 'new york', 'los angeles']
-        for dest in destinations:
-            if dest in message_lower:
-                preferences.destination = dest.title()
-                break
+        match = self._DESTINATION_RE.search(message_lower)
+        if match:
+            preferences.destination = match.group(0).title()
 
         # Default: try to understand travel planning intent
         return self._handle_general_query(message, preferences)
@@ -226,34 +282,35 @@ class CoordinatorAgent:
         if not itinerary.flights and not itinerary.hotels and not itinerary.activities:
             return "Your itinerary is empty. Start by searching for flights, hotels, or activities!"
 
-        summary = "**Your Travel Itinerary**\n\n"
+        parts = ["**Your Travel Itinerary**\n\n"]
 
         if itinerary.preferences.destination:
-            summary += f"**Destination:** {itinerary.preferences.destination}\n\n"
+            parts.append(f"**Destination:** {itinerary.preferences.destination}\n\n")
 
         if itinerary.flights:
-            summary += "**Flights:**\n"
-            for f in itinerary.flights:
-                summary += f"- {f['airline']}: {f['from']} → {f['to']} (${f['price']})\n"
-            summary += "\n"
+            parts.append("**Flights:**\n")
+            parts.extend(_SUMMARY_FLIGHT_TEMPLATE.format_map(f) for f in itinerary.flights)
+            parts.append("\n")
 
         if itinerary.hotels:
-            summary += "**Hotels:**\n"
-            for h in itinerary.hotels:
-                summary += f"- {h['name']} - ${h['price_per_night']}/night\n"
-            summary += "\n"
+            parts.append("**Hotels:**\n")
+            parts.extend(_SUMMARY_HOTEL_TEMPLATE.format_map(h) for h in itinerary.hotels)
+            parts.append("\n")
 
         if itinerary.activities:
-            summary += "**Activities:**\n"
-            for a in itinerary.activities:
-                summary += f"- {a['name']} (${a['price']})\n"
-            summary += "\n"
+            parts.append("**Activities:**\n")
+            parts.extend(_SUMMARY_ACTIVITY_TEMPLATE.format_map(a) for a in itinerary.activities)
+            parts.append("\n")
 
-        summary += f"**Estimated Total:** ${itinerary.total_cost:.2f}\n\n"
+        parts.append(f"**Estimated Total:** ${itinerary.total_cost:.2f}\n\n")
 
         if not itinerary.confirmed:
-            summary += "Type **'confirm booking'** to finalize your itinerary!"
+            parts.append("Type **'confirm booking'** to finalize your itinerary!")
         else:
-            summary += "✅ **Booking Confirmed!**"
+            parts.append("✅ **Booking Confirmed!**")
+
+        return "".join(parts)
+
 
-        return summary
+# Agents hold no per-request state, so one shared instance serves every request
+COORDINATOR = CoordinatorAgent()
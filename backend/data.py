@@ -196,13 +196,62 @@ TRAVEL_GUIDES = {
 }
 
 
+def _place_keys(place: str) -> tuple[str, ...]:
+    """Normalized lookup keys for a place, e.g. "Paris (CDG)" -> ("paris", "cdg")."""
+    name, _, code = place.partition("(")
+    keys = (name.strip().casefold(),)
+    code = code.rstrip(")").strip().casefold()
+    return keys + (code,) if code else keys
+
+
+def _normalize(query: str) -> str:
+    return query.split("(")[0].strip().casefold()
+
+
+def _build_index(items: list, field: str) -> dict[str, list]:
+    index = {}
+    for item in items:
+        for key in _place_keys(item[field]):
+            index.setdefault(key, []).append(item)
+    return index
+
+
+def _build_route_index(flights: list) -> dict[tuple[str, str], list]:
+    index = {}
+    for flight in flights:
+        for origin in _place_keys(flight["from"]):
+            for dest in _place_keys(flight["to"]):
+                index.setdefault((origin, dest), []).append(flight)
+    return index
+
+
+# Lookup indexes built once at import so searches are hash hits, not scans
+FLIGHTS_BY_ORIGIN: dict[str, list] = _build_index(FLIGHTS, "from")
+FLIGHTS_BY_DEST: dict[str, list] = _build_index(FLIGHTS, "to")
+FLIGHTS_BY_ROUTE: dict[tuple[str, str], list] = _build_route_index(FLIGHTS)
+FLIGHTS_BY_ID: dict[str, dict] = {f["id"]: f for f in FLIGHTS}
+HOTELS_BY_ID: dict[str, dict] = {h["id"]: h for h in HOTELS}
+ACTIVITIES_BY_ID: dict[str, dict] = {a["id"]: a for a in ACTIVITIES}
+
+HOTELS_BY_CITY: dict[str, list] = _build_index(HOTELS, "city")
+ACTIVITIES_BY_CITY: dict[str, list] = _build_index(ACTIVITIES, "city")
+GUIDES_LC: dict[str, dict] = {city.casefold(): {"city": city, **guide} for city, guide in TRAVEL_GUIDES.items()}
+# Fallback for queries like "Paris, France" or multi-word guide cities
+GUIDE_TOKENS: dict[str, dict] = {
+    token: guide for key, guide in GUIDES_LC.items() for token in key.split()
+}
+
+
 def search_flights(origin: str = None, destination: str = None, date: str = None) -> list:
     """Search flights with optional filters."""
-    results = FLIGHTS.copy()
-    if origin:
-        results = [f for f in results if origin.lower() in f["from"].lower()]
-    if destination:
-        results = [f for f in results if destination.lower() in f["to"].lower()]
+    if origin and destination:
+        results = FLIGHTS_BY_ROUTE.get((_normalize(origin), _normalize(destination)), [])
+    elif origin:
+        results = FLIGHTS_BY_ORIGIN.get(_normalize(origin), [])
+    elif destination:
+        results = FLIGHTS_BY_DEST.get(_normalize(destination), [])
+    else:
+        results = FLIGHTS
     if date:
         results = [f for f in results if date in f["departure"]]
     return results
@@ -210,9 +259,7 @@ def search_flights(origin: str = None, destination: str = None, date: str = None
 
 def search_hotels(city: str = None, max_price: float = None) -> list:
     """Search hotels with optional filters."""
-    results = HOTELS.copy()
-    if city:
-        results = [h for h in results if city.lower() in h["city"].lower()]
+    results = HOTELS_BY_CITY.get(_normalize(city), []) if city else HOTELS
     if max_price:
         results = [h for h in results if h["price_per_night"] <= max_price]
     return results
@@ -221,13 +268,14 @@ def search_hotels(city: str = None, max_price: float = None) -> list:
 def search_activities(city: str = None) -> list:
     """Search activities by city."""
     if city:
-        return [a for a in ACTIVITIES if city.lower() in a["city"].lower()]
-    return ACTIVITIES.copy()
+        return ACTIVITIES_BY_CITY.get(_normalize(city), [])
+    return ACTIVITIES
 
 
 def get_travel_guide(city: str) -> dict:
     """Get travel guide for a city."""
-    for guide_city, guide in TRAVEL_GUIDES.items():
-        if city.lower() in guide_city.lower():
-            return {"city": guide_city, **guide}
-    return None
+    key = _normalize(city)
+    guide = GUIDES_LC.get(key)
+    if guide is None:
+        guide = next((GUIDE_TOKENS[t] for t in key.replace(",", " ").split() if t in GUIDE_TOKENS), None)
+    return guide
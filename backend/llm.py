@@ -1,14 +1,32 @@
 """OpenAI LLM integration for Travel Concierge."""
 
 import os
+import re
+import logging
 import json
+import orjson
+from typing import Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from rag import get_rag
-from web_search import search_web, format_web_results
+from cache import TTLCache
+from agents import keyword_pattern
+from web_search import submit_web_batch, format_web_results
 
 
+log = logging.getLogger(__name__)
+
 client = None
 
+# Number of prior chat messages sent to the model each turn
+HISTORY_WINDOW = 10
+
+# Shared pool for the blocking network calls fanned out per chat turn
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm")
+
+# RAG context reused across drill-down turns, keyed by the caller's context_key
+_rag_context_cache = TTLCache(maxsize=1024, ttl=900)
+
 
 def get_client():
     global client
@@ -17,25 +35,26 @@ def get_client():
     return client
 
 
-def _extract_destination_from_message(message: str) -> str:
+# Look for "to X", "visit X", "trip to X", "travel to X", "go to X", "plan for X"
+_DEST_PATTERNS = tuple(re.compile(p) for p in (
+    r'(?:trip|travel|go|visit|going|plan|planning|fly|flying)\s+(?:to|for)\s+([a-zA-Z\s]+?)(?:\s+(?:for|in|on|with|next|this)|[,.\?!]|$)',
+    r'(?:want to|like to|planning to)\s+(?:visit|go to|see|explore)\s+([a-zA-Z\s]+?)(?:\s+(?:for|in|on|with)|[,.\?!]|$)',
+    r'^([a-zA-Z\s]+?)\s+(?:trip|travel|vacation|holiday)',
+))
+
+# Common non-destination words
+_SKIP_WORDS = frozenset({'a', 'the', 'my', 'our', 'this', 'that', 'some', 'any'})
+
+
+def extract_destination_from_message(message: str) -> str:
     """Try to extract a destination from the user message."""
-    import re
     message_lower = message.lower()
 
-    # Look for "to X", "visit X", "trip to X", "travel to X", "go to X", "plan for X"
-    patterns = [
-        r'(?:trip|travel|go|visit|going|plan|planning|fly|flying)\s+(?:to|for)\s+([a-zA-Z\s]+?)(?:\s+(?:for|in|on|with|next|this)|[,.\?!]|$)',
-        r'(?:want to|like to|planning to)\s+(?:visit|go to|see|explore)\s+([a-zA-Z\s]+?)(?:\s+(?:for|in|on|with)|[,.\?!]|$)',
-        r'^([a-zA-Z\s]+?)\s+(?:trip|travel|vacation|holiday)',
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, message_lower)
+    for pattern in _DEST_PATTERNS:
+        match = pattern.search(message_lower)
         if match:
             dest = match.group(1).strip()
-            # Filter out common non-destination words
-            skip_words = ['a', 'the', 'my', 'our', 'this', 'that', 'some', 'any']
-            if dest and dest not in skip_words and len(dest) > 2:
+            if dest and dest not in _SKIP_WORDS and len(dest) > 2:
                 return dest.title()
 
     return ""
@@ -59,30 +78,34 @@ IMPORTANT:
 - When showing flights, hotels, or activities from our system, format them clearly with IDs
 - For other destinations, provide detailed recommendations based on web search and your knowledge
 - Extract user preferences like destination, budget, and travel style from the conversation
+- When the latest message states new preferences, call update_preferences AND still write your reply to the user
 - If the user wants to confirm their booking, acknowledge it and mention the admin team has been notified
 """
 
 
-def chat_with_context(
+def _build_messages(
     user_message: str,
     chat_history: list[dict],
     preferences: dict,
-    itinerary: dict
-) -> tuple[str, dict]:
+    itinerary: dict,
+    context_key: Optional[tuple] = None
+) -> list[dict]:
     """
-    Generate a response using OpenAI with RAG context.
-    Returns (response, extracted_info)
+    Gather RAG and web context and assemble the prompt for a chat turn.
+    Turns sharing a context_key reuse the RAG context of the first one.
     """
-    rag = get_rag()
+    cached_context = _rag_context_cache.get(context_key) if context_key is not None else None
 
-    # Get RAG context
-    rag_context, found_in_rag = rag.get_context(user_message)
+    # Get RAG context in the background while web search runs
+    rag_future = None
+    if cached_context is None:
+        rag_future = _executor.submit(get_rag().get_context, user_message)
 
     # Extract destination from message for web search
-    destination = preferences.get("destination") or _extract_destination_from_message(user_message)
+    destination = preferences.get("destination") or extract_destination_from_message(user_message)
 
     # Try web search for destinations or if RAG didn't find much
-    web_context = ""
+    web_futures = []
     if destination:
         # Always do web search for travel info to supplement RAG
         search_queries = [
@@ -90,13 +113,19 @@ def chat_with_context(
             f"{destination} best hotels accommodation",
             f"{destination} things to do attractions",
         ]
-        all_web_results = []
-        for query in search_queries[:2]:  # Limit to 2 queries
-            results = search_web(query, max_results=3)
-            all_web_results.extend(results)
+        # Each query is its own task on the shared pool; no worker blocks waiting on another
+        web_futures = submit_web_batch(_executor, search_queries[:2], max_results=3)  # Limit to 2 queries
+
+    if rag_future is not None:
+        cached_context = rag_future.result()
+        if context_key is not None:
+            _rag_context_cache.set(context_key, cached_context)
+    rag_context, found_in_rag = cached_context
 
-        if all_web_results:
-            web_context = format_web_results(all_web_results[:6])
+    web_context = ""
+    all_web_results = [r for future in web_futures for r in future.result()]
+    if all_web_results:
+        web_context = format_web_results(all_web_results[:6])
 
     # Build context message
     context_parts = []
@@ -130,50 +159,217 @@ CURRENT ITINERARY:
 
     context = "\n".join(context_parts)
 
-    # Build messages
+    # Static system prompt and prior turns first so the prefix stays byte-identical
+    # from turn to turn and hits the provider's prompt cache; per-turn context goes last
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
 
-    if context:
+    # Add chat history (last HISTORY_WINDOW messages)
+    for msg in chat_history[-HISTORY_WINDOW:]:
         messages.append({
-            "role": "system",
-            "content": f"CONTEXT:\n{context}"
+            "role": msg["role"],
+            "content": msg["content"]
         })
 
-    # Add chat history (last 10 messages)
-    for msg in chat_history[-10:]:
+    if context:
         messages.append({
-            "role": msg["role"],
-            "content": msg["content"]
+            "role": "system",
+            "content": f"CONTEXT:\n{context}"
         })
 
     # Add current message
     messages.append({"role": "user", "content": user_message})
 
-    # Call OpenAI
+    return messages
+
+
+def _with_tool_results(messages: list[dict], tool_calls: list[dict]) -> list[dict]:
+    """Messages for a follow-up call after the model replied with only tool calls."""
+    return messages + [
+        {"role": "assistant", "content": None, "tool_calls": tool_calls},
+        *({"role": "tool", "tool_call_id": call["id"], "content": "Preferences saved."} for call in tool_calls),
+    ]
+
+
+def chat_with_context(
+    user_message: str,
+    chat_history: list[dict],
+    preferences: dict,
+    itinerary: dict,
+    context_key: Optional[tuple] = None
+) -> tuple[str, dict]:
+    """
+    Generate a response using OpenAI with RAG context.
+    Returns (response, extracted_info)
+    """
+    messages = _build_messages(user_message, chat_history, preferences, itinerary, context_key)
+
+    # Call OpenAI; preferences come back as a tool call on the same response
     response = get_client().chat.completions.create(
         model="gpt-4o-mini",
         messages=messages,
         temperature=0.7,
-        max_tokens=1000
+        max_tokens=1000,
+        tools=[PREFERENCES_TOOL]
     )
 
-    assistant_message = response.choices[0].message.content
+    message = response.choices[0].message
+    tool_calls = [call.model_dump() for call in message.tool_calls or []]
+    extracted = _parse_preference_calls(tool_calls)
+    if extracted is None:
+        extracted = extract_preferences(user_message, preferences)
 
-    # Extract preferences using a separate call
-    extracted = extract_preferences(user_message, preferences)
+    assistant_message = message.content
+    if not assistant_message:
+        # The model answered with only the tool call; ask for the reply itself
+        response = get_client().chat.completions.create(
+            model="gpt-4o-mini",
+            messages=_with_tool_results(messages, tool_calls),
+            temperature=0.7,
+            max_tokens=1000
+        )
+        assistant_message = response.choices[0].message.content
 
     return assistant_message, extracted
 
 
+def stream_chat_with_context(
+    user_message: str,
+    chat_history: list[dict],
+    preferences: dict,
+    itinerary: dict,
+    extracted: dict,
+    context_key: Optional[tuple] = None
+) -> Iterator[str]:
+    """
+    Stream the assistant reply as text chunks.
+    Preferences extracted on this turn are written into `extracted`
+    once the stream is exhausted.
+    """
+    messages = _build_messages(user_message, chat_history, preferences, itinerary, context_key)
+
+    stream = get_client().chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0.7,
+        max_tokens=1000,
+        tools=[PREFERENCES_TOOL],
+        stream=True
+    )
+
+    # Tool call arguments arrive in fragments keyed by call index
+    tool_calls = {}
+    has_content = False
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            has_content = True
+            yield delta.content
+        for fragment in delta.tool_calls or []:
+            call = tool_calls.setdefault(
+                fragment.index,
+                {"id": "", "type": "function", "function": {"name": "", "arguments": ""}}
+            )
+            if fragment.id:
+                call["id"] = fragment.id
+            if fragment.function:
+                call["function"]["name"] += fragment.function.name or ""
+                call["function"]["arguments"] += fragment.function.arguments or ""
+
+    calls = [tool_calls[i] for i in sorted(tool_calls)]
+    parsed = _parse_preference_calls(calls)
+    extracted.update(parsed if parsed is not None else extract_preferences(user_message, preferences))
+
+    if not has_content:
+        # The model answered with only the tool call; stream the reply itself
+        stream = get_client().chat.completions.create(
+            model="gpt-4o-mini",
+            messages=_with_tool_results(messages, calls),
+            temperature=0.7,
+            max_tokens=1000,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+PREFERENCE_FIELDS = ("destination", "origin", "start_date", "end_date", "budget", "travel_style")
+
+PREFERENCES_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "update_preferences",
+        "description": "Record travel preferences the user stated or clearly implied in their latest message.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "destination": {"type": "string", "description": "City name"},
+                "origin": {"type": "string", "description": "Departure city"},
+                "start_date": {"type": "string", "description": "YYYY-MM-DD"},
+                "end_date": {"type": "string", "description": "YYYY-MM-DD"},
+                "budget": {"type": "number", "description": "Total budget in USD"},
+                "travel_style": {"type": "string", "enum": ["budget", "moderate", "luxury"]},
+            },
+        },
+    },
+}
+
+
+# Strict schema for the fallback extraction call; unmentioned fields come back null
+PREFERENCES_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "travel_preferences",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "destination": {"type": ["string", "null"]},
+                "origin": {"type": ["string", "null"]},
+                "start_date": {"type": ["string", "null"]},
+                "end_date": {"type": ["string", "null"]},
+                "budget": {"type": ["number", "null"]},
+                "travel_style": {"type": ["string", "null"], "enum": ["budget", "moderate", "luxury", None]},
+            },
+            "required": list(PREFERENCE_FIELDS),
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+def _parse_preference_calls(tool_calls: list[dict]) -> Optional[dict]:
+    """
+    Collect preferences from update_preferences tool calls.
+    Returns None if the arguments could not be parsed.
+    """
+    extracted = {}
+    for call in tool_calls:
+        if call["function"]["name"] != "update_preferences":
+            continue
+        try:
+            arguments = json.loads(call["function"]["arguments"])
+        except json.JSONDecodeError as e:
+            log.warning("Preference tool call parse error: %s", e)
+            return None
+        extracted.update({k: v for k, v in arguments.items() if k in PREFERENCE_FIELDS})
+    return extracted
+
+
 def extract_preferences(user_message: str, current_preferences: dict) -> dict:
-    """Extract travel preferences from user message."""
-    extraction_prompt = f"""Extract travel preferences from this message. Return a JSON object with only the fields that are mentioned.
+    """
+    Extract travel preferences from user message with a dedicated call.
+    Fallback for when the update_preferences tool call is unusable.
+    """
+    extraction_prompt = f"""Extract travel preferences from this message. Return a JSON object with every field below.
 
 Current preferences: {json.dumps(current_preferences)}
 
 User message: "{user_message}"
 
-Return JSON with any of these fields if mentioned:
+Return JSON with these fields:
 - destination: string (city name)
 - origin: string (departure city)
 - start_date: string (YYYY-MM-DD format)
@@ -181,8 +377,8 @@ Return JSON with any of these fields if mentioned:
 - budget: number (total budget in USD)
 - travel_style: string (budget/moderate/luxury)
 
-Only include fields that are explicitly or clearly implied in the message.
-Return empty object {{}} if no preferences found.
+Fill in only fields that are explicitly or clearly implied in the message.
+Set every other field to null.
 """
 
     try:
@@ -190,30 +386,38 @@ Return empty object {{}} if no preferences found.
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": extraction_prompt}],
             temperature=0,
-            max_tokens=200,
-            response_format={"type": "json_object"}
+            max_tokens=120,
+            response_format=PREFERENCES_RESPONSE_FORMAT
         )
 
-        extracted = json.loads(response.choices[0].message.content)
-        return extracted
-    except Exception as e:
-        print(f"Preference extraction error: {e}")
+        extracted = orjson.loads(response.choices[0].message.content)
+        return {k: v for k, v in extracted.items() if v is not None}
+    except Exception:
+        log.exception("Preference extraction error")
         return {}
 
 
+# Checked in order; the first intent whose keywords appear wins
+_INTENT_PATTERNS = (
+    ("confirm", keyword_pattern(('confirm', 'book it', 'yes book', 'proceed', 'finalize'))),
+    ("flight_search", keyword_pattern(('flight', 'fly', 'airplane'))),
+    ("hotel_search", keyword_pattern(('hotel', 'stay', 'accommodation'))),
+    ("activity_search", keyword_pattern(('activity', 'activities', 'things to do', 'tour'))),
+    ("guide", keyword_pattern(('guide', 'tips', 'advice', 'recommend'))),
+)
+
+# Any keyword from any intent; one scan sends the common no-keyword message straight to "general"
+_ANY_INTENT_RE = re.compile("|".join(pattern.pattern for _, pattern in _INTENT_PATTERNS))
+
+
 def detect_intent(user_message: str) -> str:
     """Detect the intent of the user message."""
     message_lower = user_message.lower()
+    if not _ANY_INTENT_RE.search(message_lower):
+        return "general"
 
-    if any(word in message_lower for word in ['confirm', 'book it', 'yes book', 'proceed', 'finalize']):
-        return "confirm"
-    if any(word in message_lower for word in ['flight', 'fly', 'airplane']):
-        return "flight_search"
-    if any(word in message_lower for word in ['hotel', 'stay', 'accommodation']):
-        return "hotel_search"
-    if any(word in message_lower for word in ['activity', 'activities', 'things to do', 'tour']):
-        return "activity_search"
-    if any(word in message_lower for word in ['guide', 'tips', 'advice', 'recommend']):
-        return "guide"
+    for intent, pattern in _INTENT_PATTERNS:
+        if pattern.search(message_lower):
+            return intent
 
     return "general"
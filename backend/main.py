@@ -1,25 +1,63 @@
 """FastAPI backend for Travel Concierge AI with PostgreSQL persistence."""
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from pydantic import BaseModel, ConfigDict
 from pathlib import Path
 from typing import Optional
-from datetime import datetime
-import uuid
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+import hashlib
+import orjson
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import json
+import time
 import os
-
-from sqlalchemy.orm import Session as DBSession
-from database import init_db, get_db, Session, ChatMessage, ItineraryItem, Booking, Notification
-from agents import CoordinatorAgent, TravelPreferences, Itinerary
-from data import FLIGHTS, HOTELS, ACTIVITIES
-from llm import chat_with_context, detect_intent
+import string
+from secrets import choice, token_hex
+
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession as DBSession
+from database import (
+    init_db, get_db, engine, SessionLocal,
+    Session, ChatMessage, ItineraryItem, Booking, Notification, ResponseCache,
+)
+from agents import COORDINATOR, TravelPreferences, Itinerary, keyword_pattern
+from data import FLIGHTS_BY_ID, HOTELS_BY_ID, ACTIVITIES_BY_ID, GUIDES_LC
+from llm import (
+    chat_with_context, stream_chat_with_context, detect_intent, extract_destination_from_message, extract_preferences,
+    HISTORY_WINDOW, PREFERENCE_FIELDS,
+)
 from rag import get_rag
+from cache import TTLCache
+
+
+# Handlers only enqueue records; a listener thread does the blocking stream writes
+_log_queue = queue.SimpleQueue()
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_stream)
+_log_handler = QueueHandler(_log_queue)
+_log_handler.setFormatter(logging.Formatter("%(message)s"))  # final format is applied by _log_stream
+logging.basicConfig(level=logging.INFO, handlers=[_log_handler])
+log = logging.getLogger(__name__)
+
+
+class OrjsonResponse(JSONResponse):
+    """JSON response rendered by orjson rather than the stdlib encoder."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
 
 
-app = FastAPI(title="Travel Concierge AI")
+app = FastAPI(title="Travel Concierge AI", default_response_class=OrjsonResponse)
 
 # CORS for frontend
 app.add_middleware(
@@ -32,68 +70,90 @@ app.add_middleware(
 
 
 # Pydantic models
-class ChatMessageRequest(BaseModel):
+class RequestModel(BaseModel):
+    """Immutable request body; unknown fields are rejected with a 422."""
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+
+class ChatMessageRequest(RequestModel):
     message: str
     session_id: Optional[str] = None
 
 
-class BookingRequest(BaseModel):
+class BookingRequest(RequestModel):
     session_id: str
     item_type: str
     item_id: str
 
 
-class CustomerInfo(BaseModel):
+class CustomerInfo(RequestModel):
     session_id: str
     email: str
     name: Optional[str] = None
     phone: Optional[str] = None
 
 
-class AdminQuery(BaseModel):
+class AdminQuery(RequestModel):
     query: str
     session_id: Optional[str] = None
 
 
+def new_record_id() -> str:
+    """Random 12-character primary key for messages, itinerary items and notifications."""
+    return token_hex(6)
+
+
+def new_session_id() -> str:
+    """
+    Time-ordered session ID: 48-bit millisecond timestamp plus 40 random bits.
+    New sessions sort last, so inserts stay at the right edge of the primary key index.
+    """
+    return f"{time.time_ns() // 1_000_000:012x}{token_hex(5)}"
+
+
+BOOKING_ID_ALPHABET = string.ascii_uppercase + string.digits
+
+
 def generate_booking_id() -> str:
     """Generate a unique booking reference number."""
-    import random
-    import string
-    prefix = "TRV"
-    suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"{prefix}-{suffix}"
+    suffix = ''.join(choice(BOOKING_ID_ALPHABET) for _ in range(6))
+    return f"TRV-{suffix}"
 
 
-def get_or_create_session(session_id: Optional[str], db: DBSession) -> Session:
+async def get_or_create_session(session_id: Optional[str], db: DBSession) -> Session:
     """Get existing session or create a new one."""
     if session_id:
-        session = db.query(Session).filter(Session.id == session_id).first()
+        session = await db.get(Session, session_id)
         if session:
             return session
 
-    new_id = str(uuid.uuid4())[:8]
-    session = Session(id=new_id)
+    session = Session(id=new_session_id())
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    await db.commit()
+    await db.refresh(session)
+    _admin_cache.delete("sessions")
     return session
 
 
 def session_to_preferences(session: Session) -> TravelPreferences:
     """Convert DB session to TravelPreferences."""
-    return TravelPreferences(
-        destination=session.destination,
-        origin=session.origin,
-        start_date=session.start_date,
-        end_date=session.end_date,
-        budget=session.budget,
-        travel_style=session.travel_style
-    )
+    return TravelPreferences(**{name: getattr(session, name) for name in PREFERENCE_FIELDS})
+
+
+def stated_preferences(extracted_prefs: dict) -> dict:
+    """The preference fields an extraction actually set."""
+    return {k: v for k, v in extracted_prefs.items() if k in PREFERENCE_FIELDS and v}
 
 
-def get_session_itinerary(session: Session, db: DBSession) -> dict:
+def preferences_dict(preferences: TravelPreferences) -> dict:
+    """Preference fields as sent to the LLM and clients; interests are not stored per session."""
+    return {name: getattr(preferences, name) for name in PREFERENCE_FIELDS}
+
+
+async def get_session_itinerary(session: Session, db: DBSession) -> dict:
     """Get itinerary data from session."""
-    items = db.query(ItineraryItem).filter(ItineraryItem.session_id == session.id).all()
+    result = await db.execute(select(ItineraryItem).where(ItineraryItem.session_id == session.id))
+    items = result.scalars().all()
 
     flights = []
     hotels = []
@@ -118,75 +178,110 @@ def get_session_itinerary(session: Session, db: DBSession) -> dict:
     }
 
 
-def get_chat_history(session_id: str, db: DBSession) -> list[dict]:
-    """Get chat history for a session."""
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.session_id == session_id
-    ).order_by(ChatMessage.timestamp).all()
+def itinerary_summary(preferences: TravelPreferences, itinerary_data: dict, confirmed: bool = False) -> str:
+    """Render an itinerary summary with the shared coordinator."""
+    itinerary_obj = Itinerary(
+        preferences=preferences,
+        flights=itinerary_data["flights"],
+        hotels=itinerary_data["hotels"],
+        activities=itinerary_data["activities"],
+        total_cost=itinerary_data["total_cost"],
+        confirmed=confirmed,
+    )
+    return COORDINATOR.generate_itinerary_summary(itinerary_obj)
+
+
+async def get_chat_history(session_id: str, db: DBSession, limit: Optional[int] = None) -> list[dict]:
+    """Get chat history for a session, optionally only the latest `limit` messages."""
+    stmt = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    if limit is None:
+        result = await db.execute(stmt.order_by(ChatMessage.timestamp))
+        messages = result.scalars().all()
+    else:
+        result = await db.execute(stmt.order_by(ChatMessage.timestamp.desc()).limit(limit))
+        messages = result.scalars().all()[::-1]
 
     return [{"role": m.role, "content": m.content, "timestamp": m.timestamp.isoformat()} for m in messages]
 
 
-# ============ Customer Endpoints ============
+@dataclass
+class ChatTurn:
+    """State loaded for one chat turn before the LLM is called."""
+    session: Session
+    preferences: TravelPreferences
+    itinerary_data: dict
+    prior_history: list[dict]  # excludes the message being answered
+    intent: str
+    prefs_dict: dict
+    message: str
+    received_at: datetime
 
-@app.post("/api/chat")
-async def chat(msg: ChatMessageRequest, db: DBSession = Depends(get_db)):
-    """Main chat endpoint for customers."""
-    session = get_or_create_session(msg.session_id, db)
+
+async def start_chat_turn(msg: ChatMessageRequest, db: DBSession) -> ChatTurn:
+    """Gather everything the LLM needs; nothing is written until finish_chat_turn."""
+    received_at = datetime.utcnow()  # the user message is stamped now, not at the later flush
+    session = await get_or_create_session(msg.session_id, db)
     preferences = session_to_preferences(session)
-    itinerary_data = get_session_itinerary(session, db)
+    itinerary_data = await get_session_itinerary(session, db)
 
-    # Save user message
-    user_msg = ChatMessage(
-        id=str(uuid.uuid4())[:12],
-        session_id=session.id,
-        role="user",
-        content=msg.message
-    )
-    db.add(user_msg)
-    db.commit()
+    # Get the recent history the LLM sees
+    prior_history = await get_chat_history(session.id, db, limit=HISTORY_WINDOW)
 
-    # Get chat history
-    chat_history = get_chat_history(session.id, db)
+    # End the read transaction so the pooled connection is not held idle through
+    # the LLM call; expire_on_commit=False keeps the loaded session usable
+    await db.commit()
 
     # Detect intent
     intent = detect_intent(msg.message)
 
     # Prepare data for LLM
-    prefs_dict = {
-        "destination": preferences.destination,
-        "origin": preferences.origin,
-        "start_date": preferences.start_date,
-        "end_date": preferences.end_date,
-        "budget": preferences.budget,
-        "travel_style": preferences.travel_style,
-    }
+    prefs_dict = preferences_dict(preferences)
 
-    # Get LLM response
-    response, extracted_prefs = chat_with_context(
-        msg.message,
-        chat_history[:-1],
-        prefs_dict,
-        itinerary_data
-    )
+    return ChatTurn(session, preferences, itinerary_data, prior_history, intent, prefs_dict, msg.message, received_at)
+
+
+def index_conversation(session_id: str, messages: list[dict]):
+    """Background task: add a confirmed conversation to ChromaDB for admin RAG queries."""
+    try:
+        get_rag().add_conversation(session_id, messages)
+    except Exception:
+        log.exception("Error adding conversation to ChromaDB")
+
+
+async def finish_chat_turn(
+    turn: ChatTurn,
+    response: str,
+    extracted_prefs: dict,
+    db: DBSession,
+    background_tasks: BackgroundTasks,
+) -> dict:
+    """Apply the LLM result, handle confirmation, and save both sides of the turn."""
+    session = turn.session
+    itinerary_data = turn.itinerary_data
+
+    # Save user message
+    db.add(ChatMessage(
+        id=new_record_id(),
+        session_id=session.id,
+        role="user",
+        content=turn.message,
+        timestamp=turn.received_at
+    ))
 
-    # Update session preferences
-    if extracted_prefs.get("destination"):
-        session.destination = extracted_prefs["destination"]
-    if extracted_prefs.get("origin"):
-        session.origin = extracted_prefs["origin"]
-    if extracted_prefs.get("start_date"):
-        session.start_date = extracted_prefs["start_date"]
-    if extracted_prefs.get("end_date"):
-        session.end_date = extracted_prefs["end_date"]
-    if extracted_prefs.get("budget"):
-        session.budget = extracted_prefs["budget"]
-    if extracted_prefs.get("travel_style"):
-        session.travel_style = extracted_prefs["travel_style"]
+    updates = stated_preferences(extracted_prefs)
+    # Most turns after the first few change nothing; skip the copy then
+    preferences = replace(turn.preferences, **updates) if updates else turn.preferences
+
+    # Update session preferences; unchanged values leave the row clean
+    for name, value in updates.items():
+        if getattr(session, name) != value:
+            setattr(session, name, value)
 
     # Handle booking confirmation
     booking_id = None
-    if intent == "confirm" and itinerary_data["total_cost"] > 0:
+    if turn.intent == "confirm" and itinerary_data["total_cost"] > 0:
+        await db.flush()
+        chat_history = await get_chat_history(session.id, db)
         booking_id = generate_booking_id()
         session.booking_id = booking_id
         session.confirmed = True
@@ -200,7 +295,7 @@ async def chat(msg: ChatMessageRequest, db: DBSession = Depends(get_db)):
             customer_name=session.customer_name,
             customer_phone=session.customer_phone,
             destination=session.destination,
-            preferences=prefs_dict,
+            preferences=turn.prefs_dict,
             itinerary=itinerary_data,
             total_cost=itinerary_data["total_cost"],
             chat_summary=f"Customer had {len(chat_history)} messages"
@@ -209,85 +304,301 @@ async def chat(msg: ChatMessageRequest, db: DBSession = Depends(get_db)):
 
         # Create notification
         notification = Notification(
-            id=str(uuid.uuid4())[:12],
+            id=new_record_id(),
             booking_id=booking_id,
             data={"destination": session.destination, "total_cost": itinerary_data["total_cost"]}
         )
         db.add(notification)
 
-        # Add conversation to ChromaDB for RAG
-        try:
-            rag = get_rag()
-            rag.add_conversation(session.id, chat_history)
-        except Exception as e:
-            print(f"Error adding conversation to ChromaDB: {e}")
+        # Add conversation to ChromaDB for RAG once the response has been sent
+        background_tasks.add_task(index_conversation, session.id, chat_history)
 
     # Save assistant message
     assistant_msg = ChatMessage(
-        id=str(uuid.uuid4())[:12],
+        id=new_record_id(),
         session_id=session.id,
         role="assistant",
         content=response
     )
     db.add(assistant_msg)
-    db.commit()
-
-    # Generate itinerary summary
-    coordinator = CoordinatorAgent()
-    itinerary_obj = Itinerary(preferences=preferences)
-    itinerary_obj.flights = itinerary_data["flights"]
-    itinerary_obj.hotels = itinerary_data["hotels"]
-    itinerary_obj.activities = itinerary_data["activities"]
-    itinerary_obj.total_cost = itinerary_data["total_cost"]
-    itinerary_obj.confirmed = session.confirmed
+    await db.commit()
+    if booking_id:
+        # Only once committed, so a concurrent admin poll can't re-cache the old listing
+        _admin_cache.delete("bookings")
+        _admin_cache.delete("sessions")
 
     return {
         "session_id": session.id,
         "response": response,
-        "intent": intent,
-        "preferences": {
-            "destination": session.destination,
-            "origin": session.origin,
-            "start_date": session.start_date,
-            "end_date": session.end_date,
-            "budget": session.budget,
-            "travel_style": session.travel_style,
-        },
-        "itinerary_summary": coordinator.generate_itinerary_summary(itinerary_obj),
+        "intent": turn.intent,
+        "preferences": preferences_dict(preferences),
+        "itinerary_summary": itinerary_summary(preferences, itinerary_data, session.confirmed),
         "confirmed": session.confirmed,
         "booking_id": booking_id or session.booking_id,
     }
 
 
+RESPONSE_CACHE_TTL = timedelta(hours=1)
+SEMANTIC_CACHE_MIN_WORDS = 4
+# Expired cache entries are deleted at most this often per worker
+RESPONSE_CACHE_PRUNE_INTERVAL = 600
+_response_cache_pruned_at = 0.0
+
+# Hot tier in front of the response_cache table
+_response_cache = TTLCache(maxsize=1024, ttl=RESPONSE_CACHE_TTL.total_seconds())
+
+
+def preferences_fingerprint(turn: ChatTurn) -> str:
+    """Hash of the preference and itinerary state the LLM sees on this turn."""
+    itinerary = turn.itinerary_data
+    payload = [
+        turn.prefs_dict,
+        [len(itinerary["flights"]), len(itinerary["hotels"]), len(itinerary["activities"]), itinerary["total_cost"]],
+    ]
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def conversation_fingerprint(turn: ChatTurn) -> str:
+    """Hash of the recent history and preference state a reply depends on, besides the message."""
+    payload = [
+        [m["content"] for m in turn.prior_history[-6:]],
+        preferences_fingerprint(turn),
+    ]
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+def response_cache_key(message: str, turn: ChatTurn) -> Optional[str]:
+    """
+    Hash of everything that shapes the LLM reply for this turn.
+    Returns None when the turn must not be served from cache.
+    """
+    if turn.intent == "confirm":
+        return None
+    payload = [message, conversation_fingerprint(turn)]
+    return hashlib.blake2b(json.dumps(payload).encode(), digest_size=32).hexdigest()
+
+
+# Intents whose follow-up turns in a session draw on the same catalog slice
+RAG_REUSE_INTENTS = frozenset({"flight_search", "hotel_search", "activity_search", "guide"})
+
+
+# Catalog cities, so "hotels in Rome instead" counts as naming Rome
+_CATALOG_CITY_RE = keyword_pattern(tuple(GUIDES_LC))
+
+
+def _names_other_destination(message: str, destination: str) -> bool:
+    """Whether the message mentions a place other than the session's destination."""
+    named = set(_CATALOG_CITY_RE.findall(message.lower()))
+    extracted = extract_destination_from_message(message)
+    if extracted:
+        named.add(extracted.casefold())
+    destination = destination.casefold()
+    return any(name not in destination and destination not in name for name in named)
+
+
+def rag_context_key(message: str, turn: ChatTurn) -> Optional[tuple]:
+    """
+    Key under which the LLM layer reuses this turn's RAG context.
+    Scoped to the session, and changes whenever the destination does.
+    Returns None when the message names another place, since the stored
+    destination is from before this turn.
+    """
+    destination = turn.prefs_dict["destination"]
+    if not destination or turn.intent not in RAG_REUSE_INTENTS:
+        return None
+    if _names_other_destination(message, destination):
+        return None
+    return (turn.session.id, destination.casefold(), turn.intent)
+
+
+def _semantic_cache_eligible(message: str) -> bool:
+    # Short replies like "yes" or "the second one" only make sense with history
+    return len(message.split()) >= SEMANTIC_CACHE_MIN_WORDS
+
+
+async def get_cached_response(key: Optional[str], message: str, turn: ChatTurn, db: DBSession) -> Optional[tuple[str, dict]]:
+    """
+    Look up a cached (response, extracted_prefs) pair.
+    Tries the exact key in memory and then the DB, then a paraphrase
+    match in the semantic cache.
+    """
+    if key is None:
+        return None
+    cached = _response_cache.get(key)
+    if cached is not None:
+        return cached
+
+    entry = await db.get(ResponseCache, key)
+    await db.commit()  # as in start_chat_turn, don't hold the connection through what follows
+    if entry is not None and entry.created_at >= datetime.utcnow() - RESPONSE_CACHE_TTL:
+        cached = (entry.response, entry.extracted or {})
+    elif _semantic_cache_eligible(message):
+        hit = await run_in_threadpool(
+            get_rag().lookup_cached_response, message, conversation_fingerprint(turn), RESPONSE_CACHE_TTL.total_seconds()
+        )
+        if hit is not None:
+            # A paraphrase that differs in a date or budget gets its own reply, not one written for another user's
+            response, hit_prefs = hit
+            extracted_prefs = await run_in_threadpool(extract_preferences, message, turn.prefs_dict)
+            if stated_preferences(extracted_prefs) == stated_preferences(hit_prefs):
+                cached = (response, extracted_prefs)
+
+    if cached is not None:
+        _response_cache.set(key, cached)
+    return cached
+
+
+async def store_cached_response(
+    key: Optional[str],
+    message: str,
+    turn: ChatTurn,
+    response: str,
+    extracted_prefs: dict,
+    db: DBSession,
+    background_tasks: BackgroundTasks,
+):
+    """Stage a reply for caching; the DB entry is committed with the rest of the turn."""
+    global _response_cache_pruned_at
+    if key is None or not response:
+        return
+    _response_cache.set(key, (response, extracted_prefs))
+    if _semantic_cache_eligible(message):
+        await run_in_threadpool(
+            get_rag().store_cached_response, key, message, conversation_fingerprint(turn), response, extracted_prefs
+        )
+
+    # Upsert, so two sessions caching the same key at once can't fail each other's turn.
+    # Issued last: it opens the turn's write transaction
+    values = {"response": response, "extracted": extracted_prefs, "created_at": datetime.utcnow()}
+    await db.execute(
+        insert(ResponseCache)
+        .values(key=key, **values)
+        .on_conflict_do_update(index_elements=[ResponseCache.key], set_=values)
+    )
+    if time.monotonic() - _response_cache_pruned_at > RESPONSE_CACHE_PRUNE_INTERVAL:
+        _response_cache_pruned_at = time.monotonic()
+        background_tasks.add_task(prune_response_cache)
+
+
+async def prune_response_cache():
+    """Background task: delete response and semantic cache entries past RESPONSE_CACHE_TTL."""
+    try:
+        cutoff = datetime.utcnow() - RESPONSE_CACHE_TTL
+        async with SessionLocal() as db:
+            await db.execute(delete(ResponseCache).where(ResponseCache.created_at < cutoff))
+            await db.commit()
+    except Exception:
+        log.exception("Error pruning response cache")
+    await run_in_threadpool(get_rag().prune_cached_responses, RESPONSE_CACHE_TTL.total_seconds())
+
+
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+# ============ Customer Endpoints ============
+
+@app.post("/api/chat")
+async def chat(msg: ChatMessageRequest, background_tasks: BackgroundTasks, db: DBSession = Depends(get_db)):
+    """Main chat endpoint for customers."""
+    turn = await start_chat_turn(msg, db)
+
+    cache_key = response_cache_key(msg.message, turn)
+    cached = await get_cached_response(cache_key, msg.message, turn, db)
+    if cached:
+        response, extracted_prefs = cached
+    else:
+        # Get LLM response; the OpenAI client is blocking, so keep it off the event loop
+        response, extracted_prefs = await run_in_threadpool(
+            chat_with_context,
+            msg.message,
+            turn.prior_history,
+            turn.prefs_dict,
+            turn.itinerary_data,
+            rag_context_key(msg.message, turn)
+        )
+        await store_cached_response(cache_key, msg.message, turn, response, extracted_prefs, db, background_tasks)
+
+    return await finish_chat_turn(turn, response, extracted_prefs, db, background_tasks)
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(msg: ChatMessageRequest):
+    """
+    Streaming variant of /api/chat as server-sent events.
+    Emits {"type": "token"} events while the reply is generated, then a
+    final {"type": "done"} event with the same payload /api/chat returns.
+    """
+    # Own DB session: the stream outlives the request's dependencies
+    db = SessionLocal()
+    background_tasks = BackgroundTasks()
+    background_tasks.add_task(db.close)
+
+    async def event_stream():
+        try:
+            turn = await start_chat_turn(msg, db)
+
+            cache_key = response_cache_key(msg.message, turn)
+            cached = await get_cached_response(cache_key, msg.message, turn, db)
+            if cached:
+                response, extracted_prefs = cached
+                yield _sse({"type": "token", "content": response})
+            else:
+                extracted_prefs = {}
+                tokens = stream_chat_with_context(
+                    msg.message,
+                    turn.prior_history,
+                    turn.prefs_dict,
+                    turn.itinerary_data,
+                    extracted_prefs,
+                    rag_context_key(msg.message, turn)
+                )
+                chunks = []
+                async for token in iterate_in_threadpool(tokens):
+                    chunks.append(token)
+                    yield _sse({"type": "token", "content": token})
+                response = "".join(chunks)
+                await store_cached_response(cache_key, msg.message, turn, response, extracted_prefs, db, background_tasks)
+
+            # Committed before "done" so a booking ID is never sent for a booking that isn't saved
+            result = await finish_chat_turn(turn, response, extracted_prefs, db, background_tasks)
+            yield _sse({"type": "done", **result})
+        except BaseException:
+            await db.close()
+            raise
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        background=background_tasks,
+    )
+
+
+# item_type -> (catalog by ID, price for the booked item)
+CATALOGS = {
+    "flight": (FLIGHTS_BY_ID, lambda f: f["price"]),
+    "hotel": (HOTELS_BY_ID, lambda h: h["price_per_night"] * 3),  # 3 nights default
+    "activity": (ACTIVITIES_BY_ID, lambda a: a["price"]),
+}
+
+
 @app.post("/api/book")
 async def add_to_itinerary(booking: BookingRequest, db: DBSession = Depends(get_db)):
     """Add an item to the itinerary."""
-    session = db.query(Session).filter(Session.id == booking.session_id).first()
+    session = await db.get(Session, booking.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    item = None
-    price = 0.0
-
-    if booking.item_type == "flight":
-        item = next((f for f in FLIGHTS if f["id"] == booking.item_id), None)
-        if item:
-            price = item["price"]
-    elif booking.item_type == "hotel":
-        item = next((h for h in HOTELS if h["id"] == booking.item_id), None)
-        if item:
-            price = item["price_per_night"] * 3  # 3 nights default
-    elif booking.item_type == "activity":
-        item = next((a for a in ACTIVITIES if a["id"] == booking.item_id), None)
-        if item:
-            price = item["price"]
+    catalog, pricer = CATALOGS.get(booking.item_type, ({}, None))
+    item = catalog.get(booking.item_id)
 
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
+    price = pricer(item)
 
     # Add to itinerary
     itinerary_item = ItineraryItem(
-        id=str(uuid.uuid4())[:12],
+        id=new_record_id(),
         session_id=session.id,
         item_type=booking.item_type,
         item_id=booking.item_id,
@@ -295,91 +606,146 @@ async def add_to_itinerary(booking: BookingRequest, db: DBSession = Depends(get_
         price=price
     )
     db.add(itinerary_item)
-    db.commit()
+    await db.commit()
 
     # Get updated itinerary
-    itinerary_data = get_session_itinerary(session, db)
-
-    coordinator = CoordinatorAgent()
-    itinerary_obj = Itinerary(preferences=session_to_preferences(session))
-    itinerary_obj.flights = itinerary_data["flights"]
-    itinerary_obj.hotels = itinerary_data["hotels"]
-    itinerary_obj.activities = itinerary_data["activities"]
-    itinerary_obj.total_cost = itinerary_data["total_cost"]
+    itinerary_data = await get_session_itinerary(session, db)
 
     return {
         "success": True,
         "message": f"Added {booking.item_type} to your itinerary!",
-        "itinerary_summary": coordinator.generate_itinerary_summary(itinerary_obj),
+        "itinerary_summary": itinerary_summary(session_to_preferences(session), itinerary_data),
     }
 
 
 @app.post("/api/customer-info")
 async def save_customer_info(info: CustomerInfo, db: DBSession = Depends(get_db)):
     """Save customer contact info before confirmation."""
-    session = db.query(Session).filter(Session.id == info.session_id).first()
+    session = await db.get(Session, info.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
     session.customer_email = info.email
     session.customer_name = info.name
     session.customer_phone = info.phone
-    db.commit()
+    await db.commit()
 
     return {"success": True, "message": "Customer info saved"}
 
 
-@app.get("/api/itinerary/{session_id}")
+@app.get("/api/itinerary/{session_id}", response_model=None)
 async def get_itinerary(session_id: str, db: DBSession = Depends(get_db)):
     """Get current itinerary for a session."""
-    session = db.query(Session).filter(Session.id == session_id).first()
+    session = await db.get(Session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    itinerary_data = get_session_itinerary(session, db)
-
-    coordinator = CoordinatorAgent()
-    itinerary_obj = Itinerary(preferences=session_to_preferences(session))
-    itinerary_obj.flights = itinerary_data["flights"]
-    itinerary_obj.hotels = itinerary_data["hotels"]
-    itinerary_obj.activities = itinerary_data["activities"]
-    itinerary_obj.total_cost = itinerary_data["total_cost"]
-    itinerary_obj.confirmed = session.confirmed
+    itinerary_data = await get_session_itinerary(session, db)
 
-    return {
+    # Already JSON-safe, so skip FastAPI's jsonable_encoder walk
+    return OrjsonResponse({
         **itinerary_data,
-        "summary": coordinator.generate_itinerary_summary(itinerary_obj),
-    }
+        "summary": itinerary_summary(session_to_preferences(session), itinerary_data, session.confirmed),
+    })
 
 
 # ============ Admin Endpoints ============
 
+# Encoded listings the admin UI polls, each stored with the table version it was built from.
+# Every worker has its own copy, so a hit is only served while the version still matches;
+# message counts may lag by up to ADMIN_CACHE_TTL seconds.
+ADMIN_CACHE_TTL = 5
+_admin_cache = TTLCache(maxsize=8, ttl=ADMIN_CACHE_TTL)
+
+
+async def table_version(model, db: DBSession) -> tuple:
+    """Row count and latest updated_at; changes whenever another worker adds or updates a row."""
+    return tuple((await db.execute(select(func.count(), func.max(model.updated_at)))).one())
+
+
+def cached_listing(name: str, version: tuple) -> Optional[bytes]:
+    entry = _admin_cache.get(name)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    return None
+
+
+def etag_response(request: Request, body: bytes) -> Response:
+    """Pre-encoded JSON with an ETag; a matching If-None-Match gets an empty 304."""
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+NOTIFICATIONS_MAX = 1000
+# created_at is stamped at INSERT but rows become visible at COMMIT, so a notification
+# can appear behind a cursor that already passed it; incremental polls re-read this far back
+NOTIFICATIONS_LOOKBACK = timedelta(seconds=30)
+
+
 @app.get("/api/admin/notifications")
-async def get_notifications(db: DBSession = Depends(get_db)):
-    """Get all booking notifications for admin."""
-    notifications = db.query(Notification).order_by(Notification.created_at.desc()).all()
+async def get_notifications(
+    since: Optional[datetime] = None,
+    limit: int = Query(NOTIFICATIONS_MAX, ge=1, le=NOTIFICATIONS_MAX),
+    db: DBSession = Depends(get_db),
+):
+    """
+    Get booking notifications for admin, newest first.
+    Pass the returned cursor back as `since` to fetch only newer ones; those
+    come oldest first, so a burst larger than `limit` is paged through rather
+    than skipped. Incremental results also repeat anything from the last
+    NOTIFICATIONS_LOOKBACK, so a notification committed late is not missed;
+    clients dedupe by `id`. A transaction that takes longer than the
+    lookback to commit can still be missed.
+    """
+    stmt = (
+        select(Notification)
+        .options(joinedload(Notification.booking, innerjoin=True))
+        .limit(limit)
+    )
+    if since is None:
+        stmt = stmt.order_by(Notification.created_at.desc(), Notification.id.desc())
+    else:
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)  # column holds naive UTC
+        # Lookback from now, not from `since`: a backlog still pages forward, and a full
+        # page of recent rows stalls the cursor for at most NOTIFICATIONS_LOOKBACK
+        floor = min(since, datetime.utcnow() - NOTIFICATIONS_LOOKBACK)
+        stmt = stmt.where(Notification.created_at > floor).order_by(Notification.created_at, Notification.id)
+    notifications = (await db.execute(stmt)).scalars().all()
 
     result = []
     for n in notifications:
-        booking = db.query(Booking).filter(Booking.id == n.booking_id).first()
-        if booking:
-            result.append({
-                "id": n.id,
-                "booking_id": n.booking_id,
-                "timestamp": n.created_at.isoformat(),
-                "read": n.read,
-                "preferences": booking.preferences,
-                "itinerary": booking.itinerary,
-                "chat_summary": booking.chat_summary,
-            })
-
-    return {"notifications": result}
-
-
-@app.get("/api/admin/bookings")
-async def get_all_bookings(db: DBSession = Depends(get_db)):
+        booking = n.booking
+        result.append({
+            "id": n.id,
+            "booking_id": n.booking_id,
+            "timestamp": n.created_at.isoformat(),
+            "read": n.read,
+            "preferences": booking.preferences,
+            "itinerary": booking.itinerary,
+            "chat_summary": booking.chat_summary,
+        })
+
+    # Newest notification seen: the first row of a full listing, the last of an incremental
+    # one unless the rows returned all came from the lookback
+    if since is None:
+        cursor = result[0]["timestamp"] if result else None
+    else:
+        cursor = max(since, notifications[-1].created_at).isoformat() if notifications else since.isoformat()
+    return {"notifications": result, "cursor": cursor}
+
+
+@app.get("/api/admin/bookings", response_model=None)
+async def get_all_bookings(request: Request, db: DBSession = Depends(get_db)):
     """Get all confirmed bookings for admin."""
-    bookings = db.query(Booking).order_by(Booking.created_at.desc()).all()
+    version = await table_version(Booking, db)
+    body = cached_listing("bookings", version)
+    if body is not None:
+        return etag_response(request, body)
+
+    bookings = (await db.execute(select(Booking).order_by(Booking.created_at.desc()))).scalars().all()
 
     result = []
     for b in bookings:
@@ -399,17 +765,19 @@ async def get_all_bookings(db: DBSession = Depends(get_db)):
             "chat_summary": b.chat_summary,
         })
 
-    return {"bookings": result, "total": len(result)}
+    body = orjson.dumps({"bookings": result, "total": len(result)})
+    _admin_cache.set("bookings", (version, body))
+    return etag_response(request, body)
 
 
 @app.get("/api/admin/booking/{booking_id}")
 async def get_booking_details(booking_id: str, db: DBSession = Depends(get_db)):
     """Get detailed booking information."""
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    booking = await db.get(Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
 
-    chat_history = get_chat_history(booking.session_id, db)
+    chat_history = await get_chat_history(booking.session_id, db)
 
     return {
         "booking_id": booking.id,
@@ -431,45 +799,54 @@ async def get_booking_details(booking_id: str, db: DBSession = Depends(get_db)):
 @app.patch("/api/admin/booking/{booking_id}")
 async def update_booking_status(booking_id: str, status: str, db: DBSession = Depends(get_db)):
     """Update booking status."""
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+    booking = await db.get(Booking, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
 
-    booking.status = status
-    booking.updated_at = datetime.now()
-    db.commit()
+    booking.status = status  # updated_at is set by the database
+    await db.commit()
+    _admin_cache.delete("bookings")
 
     return {"success": True, "booking_id": booking_id, "status": status}
 
 
-@app.get("/api/admin/sessions")
-async def get_all_sessions(db: DBSession = Depends(get_db)):
+@app.get("/api/admin/sessions", response_model=None)
+async def get_all_sessions(request: Request, db: DBSession = Depends(get_db)):
     """Get all active sessions for admin."""
-    sessions = db.query(Session).order_by(Session.created_at.desc()).all()
+    version = await table_version(Session, db)
+    body = cached_listing("sessions", version)
+    if body is not None:
+        return etag_response(request, body)
+
+    sessions = (await db.execute(select(Session).order_by(Session.created_at.desc()))).scalars().all()
+    counts = dict((await db.execute(
+        select(ChatMessage.session_id, func.count()).group_by(ChatMessage.session_id)
+    )).all())
 
     result = []
     for s in sessions:
-        message_count = db.query(ChatMessage).filter(ChatMessage.session_id == s.id).count()
         result.append({
             "id": s.id,
             "created_at": s.created_at.isoformat(),
             "destination": s.destination,
             "confirmed": s.confirmed,
-            "message_count": message_count,
+            "message_count": counts.get(s.id, 0),
         })
 
-    return {"sessions": result}
+    body = orjson.dumps({"sessions": result})
+    _admin_cache.set("sessions", (version, body))
+    return etag_response(request, body)
 
 
 @app.get("/api/admin/session/{session_id}")
 async def get_session_details(session_id: str, db: DBSession = Depends(get_db)):
     """Get detailed session info for admin."""
-    session = db.query(Session).filter(Session.id == session_id).first()
+    session = await db.get(Session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    chat_history = get_chat_history(session_id, db)
-    itinerary_data = get_session_itinerary(session, db)
+    chat_history = await get_chat_history(session_id, db)
+    itinerary_data = await get_session_itinerary(session, db)
 
     return {
         "id": session.id,
@@ -493,16 +870,14 @@ async def admin_query(query: AdminQuery, db: DBSession = Depends(get_db)):
     """Admin can query over sessions and travel data using RAG."""
     rag = get_rag()
 
-    # Search conversations in ChromaDB
-    conversation_results = rag.search_conversations(query.query, query.session_id)
-
-    # Search travel data
-    travel_results = rag.search(query.query)
+    # Search conversations and travel data in ChromaDB; both block on embedding calls
+    conversation_results = await run_in_threadpool(rag.search_conversations, query.query, query.session_id)
+    travel_results = await run_in_threadpool(rag.search, query.query)
 
     # If querying specific session, get details
     session_info = None
     if query.session_id:
-        session = db.query(Session).filter(Session.id == query.session_id).first()
+        session = await db.get(Session, query.session_id)
         if session:
             session_info = {
                 "destination": session.destination,
@@ -524,40 +899,54 @@ async def admin_query(query: AdminQuery, db: DBSession = Depends(get_db)):
 FRONTEND_DIR = Path(__file__).parent.parent / "frontend"
 
 
-@app.get("/")
-async def serve_index():
-    return FileResponse(FRONTEND_DIR / "index.html")
-
-
 @app.get("/admin")
 async def serve_admin():
     return FileResponse(FRONTEND_DIR / "admin.html")
 
 
-app.mount("/", StaticFiles(directory=FRONTEND_DIR), name="static")
+# html=True serves index.html for "/"; StaticFiles also answers conditional requests with 304s
+app.mount("/", StaticFiles(directory=FRONTEND_DIR, html=True), name="static")
 
 
 # ============ Startup ============
 
+# Postgres advisory lock held while a worker indexes the travel data
+RAG_INDEX_LOCK_KEY = 0x7261675f696478  # "rag_idx"
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize database and RAG on startup."""
-    print("Initializing database...")
-    init_db()
-    print("Database initialized!")
+    _log_listener.start()
+    log.info("Initializing database...")
+    await init_db()
+    log.info("Database initialized!")
 
     if os.getenv("OPENAI_API_KEY"):
-        print("Initializing RAG with ChromaDB...")
+        log.info("Initializing RAG with ChromaDB...")
         try:
             rag = get_rag()
-            rag.index_data()
-            print("RAG initialized!")
+            # One worker embeds and stores the corpus; the others wait, then load what it stored
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": RAG_INDEX_LOCK_KEY})
+                try:
+                    await run_in_threadpool(rag.index_data)
+                finally:
+                    await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RAG_INDEX_LOCK_KEY})
+            log.info("RAG initialized!")
         except Exception as e:
-            print(f"Warning: RAG initialization failed: {e}")
+            log.warning("RAG initialization failed: %s", e)
     else:
-        print("Warning: OPENAI_API_KEY not set. LLM features disabled.")
+        log.warning("OPENAI_API_KEY not set. LLM features disabled.")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued log records."""
+    _log_listener.stop()
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers share state through Postgres and the ChromaDB server only
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=int(os.getenv("WEB_CONCURRENCY", "1")))
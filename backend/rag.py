@@ -1,15 +1,40 @@
 """RAG system with ChromaDB for travel data persistence."""
 
 import os
+import json
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 from openai import OpenAI
 from data import FLIGHTS, HOTELS, ACTIVITIES, TRAVEL_GUIDES
+from cache import TTLCache, normalize_query
 
 
+log = logging.getLogger(__name__)
+
 # ChromaDB connection
 CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
 CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
+# On-disk store used when the ChromaDB server is unreachable
+CHROMA_PATH = os.getenv("CHROMA_PATH", os.path.join(os.path.dirname(__file__), "chroma_data"))
+# Uvicorn worker processes; Chroma's local store can't be shared between processes
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Cosine distance below which a cached prompt counts as the same question
+SEMANTIC_CACHE_MAX_DISTANCE = 0.1
+
+# Most inputs the embeddings endpoint accepts in one request
+EMBEDDING_BATCH_SIZE = 2048
+
+# Cosine similarity above which an earlier query's RAG context is reused
+CONTEXT_CACHE_MIN_SIMILARITY = 0.95
+# Query embeddings kept for that lookup, oldest overwritten first
+CONTEXT_CACHE_SIZE = 1024
 
 openai_client = None
 
@@ -27,17 +52,49 @@ def get_chroma_client():
         client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
         return client
     except Exception as e:
-        print(f"ChromaDB connection failed: {e}, using in-memory fallback")
-        return chromadb.Client()
-
-
-def get_embedding(text: str) -> list[float]:
-    """Get embedding for a text string using OpenAI."""
+        if WEB_CONCURRENCY > 1:
+            log.warning("ChromaDB connection failed: %s, using an in-memory store for this worker", e)
+            return chromadb.EphemeralClient()
+        log.warning("ChromaDB connection failed: %s, using local store at %s", e, CHROMA_PATH)
+        return chromadb.PersistentClient(path=CHROMA_PATH)
+
+
+@lru_cache(maxsize=4096)
+def get_embedding(text: str) -> np.ndarray:
+    """
+    Get embedding for a text string using OpenAI, as a read-only float32 array.
+    Results are memoized per exact text; a float32 array is about an eighth
+    the size of the SDK's list of Python floats.
+    """
     response = get_openai_client().embeddings.create(
         model="text-embedding-3-small",
         input=text
     )
-    return response.data[0].embedding
+    embedding = np.array(response.data[0].embedding, dtype=np.float32)
+    embedding.flags.writeable = False
+    return embedding
+
+
+def get_embeddings(texts: list[str]) -> list[list[float]]:
+    """Embed many texts with one API request per EMBEDDING_BATCH_SIZE inputs."""
+    embeddings = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        response = get_openai_client().embeddings.create(
+            model="text-embedding-3-small",
+            input=texts[start:start + EMBEDDING_BATCH_SIZE]
+        )
+        embeddings.extend(item.embedding for item in response.data)
+    return embeddings
+
+
+def _normalize(vectors) -> np.ndarray:
+    """float32 copy of `vectors` scaled to unit length along the last axis."""
+    vectors = np.array(vectors, dtype=np.float32)
+    # Sum of squares in one pass, skipping np.linalg.norm's dispatch and temporary
+    norms = np.expand_dims(np.sqrt(np.einsum("...i,...i->...", vectors, vectors)), -1)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
 
 
 class TravelRAG:
@@ -47,6 +104,19 @@ class TravelRAG:
         self.client = get_chroma_client()
         self.collection = None
         self._initialized = False
+        # Indexed travel data, searched in-process: unit-norm embedding rows
+        # aligned with their documents and metadatas
+        self._doc_embs: Optional[np.ndarray] = None
+        self._docs: list[str] = []
+        self._metas: list[dict] = []
+        self._tags: list[str] = []
+        self._context_cache = TTLCache(maxsize=512, ttl=900)
+        self._search_cache = TTLCache(maxsize=256, ttl=900)
+        # Unit-norm query embeddings and the contexts built for them, as a ring buffer
+        self._query_embs: Optional[np.ndarray] = None
+        self._query_contexts: list[tuple[str, bool]] = []
+        self._query_next = 0
+        self._query_lock = threading.Lock()
 
     def _get_or_create_collection(self):
         """Get or create the travel data collection."""
@@ -66,16 +136,17 @@ class TravelRAG:
 
         # Check if already indexed
         if collection.count() > 0:
-            print(f"Collection already has {collection.count()} documents")
+            log.info("Collection already has %d documents", collection.count())
+            stored = collection.get(include=["embeddings", "documents", "metadatas"])
+            self._load_matrix(stored["embeddings"], stored["documents"], stored["metadatas"])
             self._initialized = True
             return
 
-        print("Indexing travel data to ChromaDB...")
+        log.info("Indexing travel data to ChromaDB...")
 
         documents = []
         metadatas = []
         ids = []
-        embeddings = []
 
         # Index flights
         for flight in FLIGHTS:
@@ -86,9 +157,8 @@ class TravelRAG:
                 f"Price: ${flight['price']} {flight['class']} class."
             )
             documents.append(content)
-            metadatas.append({"type": "flight", "item_id": flight["id"], "data": str(flight)})
+            metadatas.append({"type": "flight", "item_id": flight["id"]})
             ids.append(doc_id)
-            embeddings.append(get_embedding(content))
 
         # Index hotels
         for hotel in HOTELS:
@@ -99,9 +169,8 @@ class TravelRAG:
                 f"Amenities: {', '.join(hotel['amenities'])}. {hotel['description']}"
             )
             documents.append(content)
-            metadatas.append({"type": "hotel", "item_id": hotel["id"], "data": str(hotel)})
+            metadatas.append({"type": "hotel", "item_id": hotel["id"]})
             ids.append(doc_id)
-            embeddings.append(get_embedding(content))
 
         # Index activities
         for activity in ACTIVITIES:
@@ -112,9 +181,8 @@ class TravelRAG:
                 f"{activity['description']}"
             )
             documents.append(content)
-            metadatas.append({"type": "activity", "item_id": activity["id"], "data": str(activity)})
+            metadatas.append({"type": "activity", "item_id": activity["id"]})
             ids.append(doc_id)
-            embeddings.append(get_embedding(content))
 
         # Index travel guides
         for city, guide in TRAVEL_GUIDES.items():
@@ -126,11 +194,11 @@ class TravelRAG:
                 f"Tips: {' '.join(guide['tips'])}"
             )
             documents.append(content)
-            metadatas.append({"type": "guide", "item_id": city.lower(), "data": str(guide)})
+            metadatas.append({"type": "guide", "item_id": city.lower()})
             ids.append(doc_id)
-            embeddings.append(get_embedding(content))
 
-        # Add to collection
+        # Add to collection, embedding every document in one batched request
+        embeddings = get_embeddings(documents)
         collection.add(
             documents=documents,
             metadatas=metadatas,
@@ -138,59 +206,115 @@ class TravelRAG:
             embeddings=embeddings
         )
 
+        self._load_matrix(embeddings, documents, metadatas)
         self._initialized = True
-        print(f"Indexed {len(documents)} documents to ChromaDB!")
+        log.info("Indexed %d documents to ChromaDB", len(documents))
 
     def search(self, query: str, top_k: int = 5) -> list[dict]:
-        """Search for relevant documents."""
+        """Search for relevant documents. Results are shared; callers must not mutate them."""
+        key = (normalize_query(query), top_k)
+        cached = self._search_cache.get(key)
+        if cached is not None:
+            return cached
+
         if not self._initialized:
             self.index_data()
+        if not self._docs:
+            return []
 
-        collection = self._get_or_create_collection()
-
-        # Get query embedding
-        query_embedding = get_embedding(query)
-
-        # Search
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
-        )
-
-        # Format results
-        formatted_results = []
-        if results and results['documents']:
-            for i, doc in enumerate(results['documents'][0]):
-                formatted_results.append({
-                    "content": doc,
-                    "metadata": results['metadatas'][0][i] if results['metadatas'] else {},
-                    "distance": results['distances'][0][i] if results['distances'] else 0
-                })
-
-        return formatted_results
+        results = self._rank(_normalize(get_embedding(query)), top_k)
+        self._search_cache.set(key, results)
+        return results
+
+    def _rank(self, query_embedding: np.ndarray, top_k: int = 5) -> list[dict]:
+        """Nearest documents to a unit-norm query embedding."""
+        top, distances = self._nearest(query_embedding, top_k)
+        return [
+            {
+                "content": self._docs[i],
+                "metadata": self._metas[i] or {},
+                "distance": float(distance)
+            }
+            for i, distance in zip(top, distances)
+        ]
+
+    def _nearest(self, query_embedding: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Indices of the top_k documents, nearest first, and their distances."""
+        if not self._docs:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        scores = self._doc_embs @ query_embedding
+        # Partition out the top_k, then order only those
+        if top_k < len(scores):
+            top = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        # Squared L2 between unit vectors, the same scale Chroma's default space reports
+        return top, 2 - 2 * scores[top]
+
+    def _load_matrix(self, embeddings, documents: list[str], metadatas: list[dict]):
+        """Keep the corpus in memory so a search is one matrix-vector product."""
+        self._doc_embs = _normalize(embeddings).reshape(len(documents), -1)
+        self._docs = list(documents)
+        self._metas = list(metadatas)
+        # Context prefix per document, so building a context does no string work per hit
+        self._tags = [f"[{(meta or {}).get('type', 'unknown').upper()}] " for meta in self._metas]
 
     def get_context(self, query: str) -> tuple[str, bool]:
         """
         Get context for a query.
         Returns (context_string, found_in_rag)
         """
-        results = self.search(query)
-
-        if not results:
-            return "", False
+        key = normalize_query(query)
+        cached = self._context_cache.get(key)
+        if cached is not None:
+            return cached
+
+        embedding = _normalize(get_embedding(query))
+        context = self._similar_context(embedding)
+        if context is None:
+            context = self._build_context(embedding)
+            self._remember_context(embedding, context)
+        self._context_cache.set(key, context)
+        return context
+
+    def _similar_context(self, embedding: np.ndarray) -> Optional[tuple[str, bool]]:
+        """Context of the most similar earlier query, if it is a near-duplicate."""
+        with self._query_lock:
+            if not self._query_contexts:
+                return None
+            scores = self._query_embs[:len(self._query_contexts)] @ embedding
+            best = int(scores.argmax())
+            if scores[best] > CONTEXT_CACHE_MIN_SIMILARITY:
+                return self._query_contexts[best]
+        return None
+
+    def _remember_context(self, embedding: np.ndarray, context: tuple[str, bool]):
+        with self._query_lock:
+            if self._query_embs is None:
+                self._query_embs = np.zeros((CONTEXT_CACHE_SIZE, embedding.shape[0]), dtype=np.float32)
+            slot = self._query_next
+            self._query_embs[slot] = embedding
+            if slot < len(self._query_contexts):
+                self._query_contexts[slot] = context
+            else:
+                self._query_contexts.append(context)
+            self._query_next = (slot + 1) % CONTEXT_CACHE_SIZE
+
+    def _build_context(self, embedding: np.ndarray) -> tuple[str, bool]:
+        if not self._initialized:
+            self.index_data()
+        top, distances = self._nearest(embedding, 5)
 
         # Filter by distance (lower is better, threshold ~1.5 for relevance)
-        relevant_results = [r for r in results if r.get('distance', 2) < 1.5]
+        relevant = top[distances < 1.5]
 
-        if not relevant_results:
+        if not len(relevant):
             return "", False
 
-        context_parts = []
-        for result in relevant_results:
-            doc_type = result['metadata'].get('type', 'unknown').upper()
-            context_parts.append(f"[{doc_type}] {result['content']}")
-
-        return "\n\n".join(context_parts), True
+        return "\n\n".join(self._tags[i] + self._docs[i] for i in relevant), True
 
     def add_conversation(self, session_id: str, messages: list[dict]):
         """Add conversation to ChromaDB for admin RAG queries."""
@@ -199,27 +323,29 @@ class TravelRAG:
             metadata={"description": "Customer conversations"}
         )
 
-        for i, msg in enumerate(messages):
-            doc_id = f"{session_id}_{i}"
-            content = f"{msg['role']}: {msg['content']}"
-
-            try:
-                embedding = get_embedding(content)
-                collection.upsert(
-                    documents=[content],
-                    metadatas=[{"session_id": session_id, "role": msg['role'], "timestamp": msg.get('timestamp', '')}],
-                    ids=[doc_id],
-                    embeddings=[embedding]
-                )
-            except Exception as e:
-                print(f"Error adding conversation to ChromaDB: {e}")
+        if not messages:
+            return
+
+        contents = [f"{msg['role']}: {msg['content']}" for msg in messages]
+        try:
+            collection.upsert(
+                documents=contents,
+                metadatas=[
+                    {"session_id": session_id, "role": msg['role'], "timestamp": msg.get('timestamp', '')}
+                    for msg in messages
+                ],
+                ids=[f"{session_id}_{i}" for i in range(len(messages))],
+                embeddings=get_embeddings(contents)
+            )
+        except Exception:
+            log.exception("Error adding conversation to ChromaDB")
 
     def search_conversations(self, query: str, session_id: str = None, top_k: int = 10) -> list[dict]:
         """Search conversations for admin queries."""
         try:
             collection = self.client.get_or_create_collection(name="conversations")
 
-            query_embedding = get_embedding(query)
+            query_embedding = get_embedding(query).tolist()
 
             where_filter = {"session_id": session_id} if session_id else None
 
@@ -238,10 +364,64 @@ class TravelRAG:
                     })
 
             return formatted
-        except Exception as e:
-            print(f"Error searching conversations: {e}")
+        except Exception:
+            log.exception("Error searching conversations")
             return []
 
+    def _semantic_cache_collection(self):
+        return self.client.get_or_create_collection(
+            name="llm_semantic_cache",
+            metadata={"description": "Cached chat replies", "hnsw:space": "cosine"}
+        )
+
+    def lookup_cached_response(self, prompt: str, fingerprint: str, max_age: float) -> Optional[tuple[str, dict]]:
+        """
+        Find a cached reply to a near-duplicate prompt made in the same conversation
+        state, stored within the last `max_age` seconds.
+        Returns (response, extracted_prefs) or None. A paraphrase can state another
+        date or budget, so callers must check the preferences before using the reply.
+        """
+        try:
+            results = self._semantic_cache_collection().query(
+                query_embeddings=[get_embedding(prompt).tolist()],
+                n_results=1,
+                where={"$and": [
+                    {"fingerprint": fingerprint},
+                    {"created_at": {"$gte": time.time() - max_age}},
+                ]}
+            )
+            if not results['ids'][0] or results['distances'][0][0] >= SEMANTIC_CACHE_MAX_DISTANCE:
+                return None
+            metadata = results['metadatas'][0][0]
+            return metadata["response"], json.loads(metadata.get("extracted", "{}"))
+        except Exception:
+            log.exception("Error reading semantic cache")
+            return None
+
+    def store_cached_response(self, cache_id: str, prompt: str, fingerprint: str, response: str, extracted: dict):
+        """Remember a reply, and the preferences stated with it, so paraphrases of `prompt` can reuse it."""
+        try:
+            self._semantic_cache_collection().upsert(
+                documents=[prompt],
+                metadatas=[{
+                    "fingerprint": fingerprint,
+                    "response": response,
+                    "extracted": json.dumps(extracted),
+                    "created_at": time.time(),
+                }],
+                ids=[cache_id],
+                embeddings=[get_embedding(prompt).tolist()]
+            )
+        except Exception:
+            log.exception("Error writing semantic cache")
+
+    def prune_cached_responses(self, max_age: float):
+        """Delete semantic cache entries older than `max_age` seconds."""
+        try:
+            self._semantic_cache_collection().delete(where={"created_at": {"$lt": time.time() - max_age}})
+        except Exception:
+            log.exception("Error pruning semantic cache")
+
 
 # Singleton instance
 _rag_instance = None
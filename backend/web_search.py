@@ -1,6 +1,26 @@
 """Web search fallback using DuckDuckGo."""
 
+import logging
+import threading
+from concurrent.futures import Executor, Future
 from duckduckgo_search import DDGS
+from cache import TTLCache, normalize_query
+
+
+log = logging.getLogger(__name__)
+
+# Repeat queries across chat turns are served from here; failures are not cached
+_search_cache = TTLCache(maxsize=512, ttl=900)
+
+# One client per worker thread so its HTTP connections stay open between searches
+_ddgs_local = threading.local()
+
+
+def _get_ddgs() -> DDGS:
+    ddgs = getattr(_ddgs_local, "client", None)
+    if ddgs is None:
+        ddgs = _ddgs_local.client = DDGS()
+    return ddgs
 
 
 def search_web(query: str, max_results: int = 5) -> list[dict]:
@@ -8,32 +28,49 @@ def search_web(query: str, max_results: int = 5) -> list[dict]:
     Search the web using DuckDuckGo.
     Returns list of results with title, url, and snippet.
     """
+    key = (normalize_query(query), max_results)
+    cached = _search_cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.text(query, max_results=max_results))
-            return [
-                {
-                    "title": r.get("title", ""),
-                    "url": r.get("href", ""),
-                    "snippet": r.get("body", "")
-                }
-                for r in results
-            ]
+        results = list(_get_ddgs().text(query, max_results=max_results))
+        formatted = [
+            {
+                "title": r.get("title", ""),
+                "url": r.get("href", ""),
+                "snippet": r.get("body", "")
+            }
+            for r in results
+        ]
+        _search_cache.set(key, formatted)
+        return formatted
     except Exception as e:
-        print(f"Web search error: {e}")
+        log.warning("Web search error: %s", e)
+        # Start the next search on a fresh client in case this one's connection broke
+        _ddgs_local.client = None
         return []
 
 
+def submit_web_batch(executor: Executor, queries: list[str], max_results: int = 5) -> list[Future]:
+    """
+    Start searches for several queries on `executor` without waiting for them.
+    DuckDuckGo has no batch endpoint, so distinct queries run as separate
+    tasks and duplicates share one.
+    Returns one future per query, in order.
+    """
+    futures = {}
+    for q in dict.fromkeys(map(normalize_query, queries)):
+        futures[q] = executor.submit(search_web, q, max_results)
+    return [futures[normalize_query(q)] for q in queries]
+
+
 def format_web_results(results: list[dict]) -> str:
     """Format web search results as context string."""
     if not results:
         return ""
 
-    parts = ["[WEB SEARCH RESULTS]"]
-    for r in results:
-        parts.append(f"- {r['title']}: {r['snippet']}")
-
-    return "\n".join(parts)
+    return "\n".join(["[WEB SEARCH RESULTS]"] + [f"- {r['title']}: {r['snippet']}" for r in results])
 
 
 def search_travel_info(destination: str, topic: str = "") -> str: